@@ -3,6 +3,7 @@ def handler(event, context):
     Simple example handler.
 
     - event: dict with keys {method, path, query, headers, body}
+      (body is bytes; use body.text or str(body) for the decoded string)
     - context: dict with metadata like {function}
 
     Return either:
@@ -3,3 +3,14 @@ __all__ = [
 ]
 
 __version__ = "0.1.2"
+
+_LAZY_SUBMODULES = ("cli", "runtime", "server", "utils")
+
+
+def __getattr__(name: str):
+    # Resolve submodules on first attribute access so `import fnctl` stays cheap.
+    if name in _LAZY_SUBMODULES:
+        import importlib
+
+        return importlib.import_module(f".{name}", __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,20 +1,69 @@
 import argparse
 import os
-import shutil
 import sys
 import time
 from pathlib import Path
 from typing import Optional
 
 from . import __version__
-from .server import serve as run_server
 from .utils import ensure_dirs, functions_dir, fn_dir, fn_config_path, read_json, write_json, logs_dir, log_path
 
 
 PY_TEMPLATE_REL = Path("templates/python/main.py")
 
+_IN_MODIFY = 0x00000002
+
+
+def _inotify_watch(path: Path) -> Optional[int]:
+    """Return a non-blocking inotify fd watching ``path`` for writes, or None."""
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        import ctypes
+
+        libc = ctypes.CDLL(None, use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+    except (OSError, AttributeError):
+        return None
+    if fd < 0:
+        return None
+    if libc.inotify_add_watch(fd, os.fsencode(str(path)), _IN_MODIFY) < 0:
+        os.close(fd)
+        return None
+    return fd
+
+
+def _tail_follow(path: Path) -> None:
+    # Block on inotify where available instead of waking up on a timer
+    import select
+
+    watch_fd = _inotify_watch(path)
+    try:
+        with path.open("r", encoding="utf-8") as f:
+            # go to end
+            f.seek(0, os.SEEK_END)
+            while True:
+                line = f.readline()
+                if line:
+                    print(line, end="")
+                    continue
+                if watch_fd is None:
+                    time.sleep(0.1)
+                    continue
+                ready, _, _ = select.select([watch_fd], [], [], 5.0)
+                if ready:
+                    try:
+                        os.read(watch_fd, 4096)
+                    except BlockingIOError:
+                        pass
+    finally:
+        if watch_fd is not None:
+            os.close(watch_fd)
+
 
 def cmd_create(args: argparse.Namespace) -> int:
+    import shutil
+
     ensure_dirs()
     name: str = args.name
     lang: str = args.lang
@@ -36,13 +85,20 @@ def cmd_create(args: argparse.Namespace) -> int:
         shutil.copy2(tpl_path, base / "main.py")
     elif lang == "exec":
         cfg["command"] = args.command or "./handler.sh"
+        # the generated handler speaks the line-framed worker protocol; a custom
+        # --command is run once per request unless "persistent" is set later
+        cfg["persistent"] = args.command is None
         # create a simple shell template
         sh = base / "handler.sh"
         sh.write_text("""#!/usr/bin/env bash
 set -euo pipefail
-# Read JSON from stdin and echo a JSON response
-read INPUT
-echo '{"statusCode":200, "headers":{"Content-Type":"text/plain"}, "body":"hello from exec"}'
+# fnctl keeps this script running and writes one JSON request per line to
+# stdin: {"event": {...}, "context": {...}}. Answer each request with exactly
+# one JSON line on stdout, and keep looping: if the script exits, the request
+# sent to it fails with a 500.
+while IFS= read -r INPUT; do
+  echo '{"statusCode":200, "headers":{"Content-Type":"text/plain"}, "body":"hello from exec"}'
+done
 """, encoding="utf-8")
         sh.chmod(0o755)
     else:
@@ -58,6 +114,8 @@ echo '{"statusCode":200, "headers":{"Content-Type":"text/plain"}, "body":"hello
 
 
 def cmd_destroy(args: argparse.Namespace) -> int:
+    import shutil
+
     name: str = args.name
     base = fn_dir(name)
     if not base.exists():
@@ -77,18 +135,18 @@ def cmd_list(_: argparse.Namespace) -> int:
     ensure_dirs()
     base = functions_dir()
     rows = []
-    for p in sorted(base.glob("*")):
-        if not p.is_dir():
-            continue
-        cfg_path = p / "fnctl.json"
-        if not cfg_path.exists():
+    with os.scandir(base) as it:
+        entries = sorted((e for e in it if e.is_dir()), key=lambda e: e.name)
+    for entry in entries:
+        cfg_path = Path(entry.path) / "fnctl.json"
+        if not cfg_path.is_file():
             continue
         cfg = read_json(cfg_path)
-        rows.append((cfg.get("name", p.name), cfg.get("language", "?"), bool(cfg.get("logging", True))))
+        logging = bool(cfg.get("logging", True))
+        rows.append((cfg.get("name", entry.name), cfg.get("language", "?"), "true" if logging else "false"))
     if not rows:
         print("No functions found. Create one with: fnctl create <name>")
         return 0
-    rows = [(name, lang, "true" if logging else "false") for name, lang, logging in rows]
     headers = ("NAME", "LANG", "LOGGING")
     widths = [max(len(headers[i]), max(len(row[i]) for row in rows)) for i in range(len(headers))]
     def fmt_row(row) -> str:
@@ -110,18 +168,11 @@ def cmd_logs(args: argparse.Namespace) -> int:
         print(lp.read_text(encoding="utf-8"))
         return 0
     # tail -f
-    with lp.open("r", encoding="utf-8") as f:
-        # go to end
-        f.seek(0, os.SEEK_END)
-        try:
-            while True:
-                line = f.readline()
-                if not line:
-                    time.sleep(0.5)
-                    continue
-                print(line, end="")
-        except KeyboardInterrupt:
-            return 0
+    try:
+        _tail_follow(lp)
+    except KeyboardInterrupt:
+        pass
+    return 0
 
 
 def cmd_enable_logs(args: argparse.Namespace) -> int:
@@ -151,9 +202,13 @@ def cmd_disable_logs(args: argparse.Namespace) -> int:
 
 
 def cmd_serve(args: argparse.Namespace) -> int:
+    # Imported lazily: the server pulls in http.server, subprocess, importlib
+    # and friends, which short-lived commands like `list` never need.
+    from .server import serve as run_server
+
     host = args.host
     port = args.port
-    run_server(host=host, port=port, quiet=getattr(args, "quiet", False))
+    run_server(host=host, port=port, quiet=getattr(args, "quiet", False), workers=args.workers)
     return 0
 
 
@@ -179,8 +234,9 @@ def build_parser() -> argparse.ArgumentParser:
 
     s = sub.add_parser("serve", help="Run the HTTP server")
     s.add_argument("--host", default="127.0.0.1")
-    s.add_argument("--port", type=int, default=8080)
+    s.add_argument("--port", type=int, default=8080, help="Port to bind; 0 picks a free one and prints it")
     s.add_argument("--quiet", action="store_true", help="Suppress HTTP access logs")
+    s.add_argument("--workers", type=int, default=1, help="Number of server processes sharing the port (Linux/BSD)")
     s.set_defaults(func=cmd_serve)
 
     g = sub.add_parser("logs", help="Show or follow function logs")
@@ -199,10 +255,16 @@ def build_parser() -> argparse.ArgumentParser:
     return p
 
 
+_PARSER: Optional[argparse.ArgumentParser] = None
+
+
 def main(argv: Optional[list] = None) -> int:
+    global _PARSER
     ensure_dirs()
-    parser = build_parser()
-    args = parser.parse_args(argv)
+    # Built on first use and reused, so repeated in-process calls skip setup
+    if _PARSER is None:
+        _PARSER = build_parser()
+    args = _PARSER.parse_args(argv)
     return int(args.func(args))
 
 
@@ -1,15 +1,65 @@
+import atexit
+import functools
+import hashlib
 import importlib.util
 import json
 import os
+import queue
+import re
+import select
+import shlex
+import signal
 import subprocess
 import sys
 import threading
 import time
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Any, Callable, Dict, Optional, Tuple
+from typing import Any, BinaryIO, Callable, Dict, List, Optional, Tuple
 
-from .utils import fn_config_path, read_json, log_path
+from .utils import fn_config_path, functions_dir, read_json, log_path
+
+try:
+    import orjson
+except ImportError:  # optional speedup; stdlib json is the fallback
+    orjson = None
+
+
+def _json_default(obj: Any) -> Any:
+    # Request bodies are bytes; render them as text in exec payloads and logs.
+    # Other bytes (e.g. in a handler's response) stay unserializable.
+    if isinstance(obj, RequestBody):
+        return obj.text
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _dumps(obj: Any, sort_keys: bool = False) -> bytes:
+    """Serialize ``obj`` to JSON bytes, using orjson when it is installed."""
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        try:
+            return orjson.dumps(obj, default=_json_default, option=option)
+        except orjson.JSONEncodeError:
+            # orjson is stricter (e.g. ints beyond 64 bits); whatever stdlib
+            # json accepts must serialize the same with or without the extra
+            pass
+    return json.dumps(obj, default=_json_default, sort_keys=sort_keys).encode()
+
+
+class RequestBody(bytes):
+    """Raw request body; decoded to text only when ``.text`` or ``str()`` is used."""
+
+    @property
+    def text(self) -> str:
+        text = self.__dict__.get("_text")
+        if text is None:
+            text = self.__dict__["_text"] = self.decode(errors="ignore")
+        return text
+
+    def __str__(self) -> str:
+        return self.text
 
 
 @dataclass
@@ -19,24 +69,93 @@ class FunctionSpec:
     entrypoint: Optional[str] = None  # e.g., "main:handler" for python
     command: Optional[str] = None     # e.g., "/usr/local/bin/myfn"
     logging: bool = True
+    persistent: bool = False  # exec only: keep the command running between requests
+    # exec only: pre-split command, or None when it has to go through the shell
+    argv: Optional[List[str]] = field(default=None, init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        self.argv = _split_command(self.command) if self.language == "exec" else None
+
+
+# Anything the shell would interpret differently from shlex.split; plain quotes
+# are fine since shlex handles them like sh once $, ` and \ are ruled out
+_SHELL_METACHARS = frozenset("|&;<>()$`\\*?[]{}~#\n")
+# POSIX special builtins, common regular builtins and reserved words: these
+# only mean something to the shell (``exec python3 handler.py``)
+_SHELL_WORDS = frozenset({
+    ".", ":", "alias", "bg", "break", "case", "cd", "command", "continue",
+    "do", "done", "elif", "else", "esac", "eval", "exec", "exit", "export",
+    "fc", "fg", "fi", "for", "getopts", "hash", "if", "jobs", "local", "read",
+    "readonly", "return", "set", "shift", "source", "then", "times", "trap",
+    "type", "ulimit", "umask", "unalias", "unset", "until", "wait", "while",
+})
+
+
+def _split_command(command: Optional[str]) -> Optional[List[str]]:
+    if not command or os.name != "posix" or any(c in _SHELL_METACHARS for c in command):
+        return None
+    try:
+        argv = shlex.split(command)
+    except ValueError:
+        # unbalanced quotes: let the shell report it
+        return None
+    # leading VAR=value assignments and builtins are shell features too
+    if not argv or "=" in argv[0] or argv[0] in _SHELL_WORDS:
+        return None
+    return argv
+
+
+def _command_args(spec: "FunctionSpec") -> Tuple[Any, bool]:
+    """Return (args, shell) for Popen, skipping /bin/sh when the command allows it."""
+    if spec.argv is not None:
+        return spec.argv, False
+    return spec.command, True
 
 
 _PY_CACHE_LOCK = threading.Lock()
-_PY_MODULE_CACHE: Dict[str, Tuple[float, Callable]] = {}
+# "<base>:<entrypoint>" -> (module mtime_ns, handler, monotonic time of last stat)
+_PY_MODULE_CACHE: Dict[str, Tuple[int, Callable, float]] = {}
+# Seconds a cached handler is trusted before its file is stat'ed again
+PY_RELOAD_CHECK_INTERVAL = 1.0
+_MODULE_NAME_UNSAFE = re.compile(r"[^A-Za-z0-9_]")
+
+EXEC_TIMEOUT = 120
+
+# Idle long-lived exec workers, keyed by (function dir, command), along with
+# the stamp of the script they were started from
+_EXEC_POOL_LOCK = threading.Lock()
+_EXEC_POOL: Dict[Tuple[str, str], Tuple[int, "queue.Queue[subprocess.Popen]"]] = {}
+
 
+def load_spec(name: str, home: Optional[Path] = None) -> FunctionSpec:
+    cfg_path = fn_config_path(name, home)
+    st = cfg_path.stat()
+    # write_json swaps in a new file, so the inode changes even when a rewrite
+    # lands within the filesystem's timestamp granularity.
+    return _read_spec(str(cfg_path), st.st_mtime_ns, st.st_ino)
 
-def load_spec(name: str) -> FunctionSpec:
-    cfg = read_json(fn_config_path(name))
+
+@functools.lru_cache(maxsize=128)
+def _read_spec(cfg_path: str, mtime_ns: int, ino: int) -> FunctionSpec:
+    # Keyed on the file's stamp, so an edited config is a cache miss
+    cfg = read_json(Path(cfg_path))
     return FunctionSpec(
         name=cfg["name"],
         language=cfg.get("language", "python"),
         entrypoint=cfg.get("entrypoint"),
         command=cfg.get("command"),
         logging=bool(cfg.get("logging", True)),
+        persistent=bool(cfg.get("persistent", False)),
     )
 
 
 def _import_python_handler(base: Path, entrypoint: str) -> Callable:
+    entry_key = f"{base}:{entrypoint}"
+    # Within the recheck window, trust the cached handler without touching disk
+    with _PY_CACHE_LOCK:
+        cached = _PY_MODULE_CACHE.get(entry_key)
+    if cached and time.monotonic() - cached[2] < PY_RELOAD_CHECK_INTERVAL:
+        return cached[1]
     module_file, _, func_name = entrypoint.partition(":")
     if not func_name:
         raise RuntimeError("Invalid entrypoint; expected 'module.py:handler'")
@@ -48,24 +167,230 @@ def _import_python_handler(base: Path, entrypoint: str) -> Callable:
     if not candidate.exists():
         raise RuntimeError(f"Entrypoint module not found: {candidate}")
     file_path = candidate
-    mtime = file_path.stat().st_mtime
-    cache_key = str(file_path)
+    mtime = file_path.stat().st_mtime_ns
     with _PY_CACHE_LOCK:
-        cached = _PY_MODULE_CACHE.get(cache_key)
+        cached = _PY_MODULE_CACHE.get(entry_key)
         if cached and cached[0] == mtime:
+            _PY_MODULE_CACHE[entry_key] = (mtime, cached[1], time.monotonic())
             return cached[1]
-        # load fresh
-        spec = importlib.util.spec_from_file_location(f"fnctl_{hash(cache_key)}", str(file_path))
+        # load fresh under a name derived from the path, replacing any previous
+        # version so reloads don't leave orphaned modules in sys.modules; the
+        # digest keeps paths that sanitize alike (my-fn vs my_fn) apart
+        path = str(file_path)
+        digest = hashlib.sha1(path.encode()).hexdigest()[:8]
+        mod_name = f"fnctl_fn_{_MODULE_NAME_UNSAFE.sub('_', path)}_{digest}"
+        sys.modules.pop(mod_name, None)
+        spec = importlib.util.spec_from_file_location(mod_name, path)
         if spec is None or spec.loader is None:
             raise RuntimeError(f"Cannot load module from {file_path}")
         mod = importlib.util.module_from_spec(spec)
-        sys.modules[spec.name] = mod
-        spec.loader.exec_module(mod)  # type: ignore
+        sys.modules[mod_name] = mod
+        try:
+            spec.loader.exec_module(mod)  # type: ignore
+        except BaseException:
+            sys.modules.pop(mod_name, None)
+            raise
         handler = getattr(mod, func_name)
-        _PY_MODULE_CACHE[cache_key] = (mtime, handler)
+        _PY_MODULE_CACHE[entry_key] = (mtime, handler, time.monotonic())
         return handler
 
 
+def prewarm_all() -> int:
+    """Load every function spec and import Python handlers ahead of traffic.
+
+    Functions that fail to load are skipped; the error surfaces again on their
+    first request. Returns the number of Python handlers warmed.
+    """
+    warmed = 0
+    for cfg_path in sorted(functions_dir().glob("*/fnctl.json")):
+        base = cfg_path.parent
+        try:
+            spec = load_spec(base.name)
+            if spec.language == "python" and spec.entrypoint:
+                _import_python_handler(base, spec.entrypoint)
+                warmed += 1
+        except Exception:
+            continue
+    return warmed
+
+
+def _spawn_exec_worker(spec: FunctionSpec, base_dir: Path) -> subprocess.Popen:
+    # stderr is inherited: a long-lived worker would block on a pipe nobody drains.
+    # Unbuffered pipes let us select() on the raw fds; a session of its own lets
+    # a timeout kill the worker together with anything it started.
+    args, shell = _command_args(spec)
+    proc = subprocess.Popen(
+        args,
+        shell=shell,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        cwd=str(base_dir),
+        bufsize=0,
+        start_new_session=True,
+    )
+    assert proc.stdin is not None
+    os.set_blocking(proc.stdin.fileno(), False)
+    return proc
+
+
+def _worker_timed_out(proc: subprocess.Popen) -> subprocess.TimeoutExpired:
+    _discard_worker(proc)
+    return subprocess.TimeoutExpired(proc.args, EXEC_TIMEOUT)
+
+
+def _send_request(proc: subprocess.Popen, payload: bytes, deadline: float) -> bool:
+    """Write ``payload`` to the worker; False if it was gone before reading any of it."""
+    assert proc.stdin is not None
+    if proc.poll() is not None:
+        return False
+    fd = proc.stdin.fileno()
+    view = memoryview(payload)
+    while view:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise _worker_timed_out(proc)
+        if not select.select([], [fd], [], remaining)[1]:
+            continue
+        try:
+            written = os.write(fd, view)
+        except BlockingIOError:
+            continue
+        except BrokenPipeError:
+            if len(view) == len(payload):
+                return False
+            returncode = _discard_worker(proc)
+            raise RuntimeError(f"exec worker exited while reading the request (code {returncode})")
+        view = view[written:]
+    return True
+
+
+def _read_reply(proc: subprocess.Popen, deadline: float) -> bytes:
+    """Read one reply line; b"" means the worker exited without answering."""
+    assert proc.stdout is not None
+    fd = proc.stdout.fileno()
+    chunks: List[bytes] = []
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0 or not select.select([fd], [], [], remaining)[0]:
+            raise _worker_timed_out(proc)
+        data = os.read(fd, 65536)
+        if not data:
+            return b"".join(chunks)
+        chunks.append(data)
+        if b"\n" in data:
+            break
+    line, _, rest = b"".join(chunks).partition(b"\n")
+    if rest:
+        # output past the reply line would be read as the next reply
+        _discard_worker(proc)
+    return line + b"\n"
+
+
+def _discard_worker(proc: subprocess.Popen) -> int:
+    if proc.stdout is not None and proc.stdout.closed:
+        # already discarded; its pid may belong to someone else by now
+        return proc.returncode
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except OSError:
+        # the whole session has already exited
+        pass
+    returncode = proc.wait()
+    for pipe in (proc.stdin, proc.stdout):
+        if pipe is not None:
+            pipe.close()
+    return returncode
+
+
+def _command_stamp(spec: FunctionSpec, base_dir: Path) -> int:
+    # mtime of the program the command starts, e.g. the generated handler.sh
+    words = spec.argv or (spec.command or "").split()
+    if not words:
+        return 0
+    try:
+        return (base_dir / words[0]).stat().st_mtime_ns
+    except OSError:
+        return 0
+
+
+def _drain_pool(pool: "queue.Queue[subprocess.Popen]") -> None:
+    while True:
+        try:
+            proc = pool.get_nowait()
+        except queue.Empty:
+            break
+        _discard_worker(proc)
+
+
+def _exec_pool(key: Tuple[str, str], stamp: int) -> "queue.Queue[subprocess.Popen]":
+    """Return the idle-worker pool for ``key``, dropping workers of an older script."""
+    stale = None
+    with _EXEC_POOL_LOCK:
+        entry = _EXEC_POOL.get(key)
+        if entry is None or entry[0] != stamp:
+            if entry is not None:
+                stale = entry[1]
+            entry = _EXEC_POOL[key] = (stamp, queue.Queue())
+    if stale is not None:
+        _drain_pool(stale)
+    return entry[1]
+
+
+def _release_worker(key: Tuple[str, str], pool: "queue.Queue[subprocess.Popen]", proc: subprocess.Popen) -> None:
+    # a worker whose pool was replaced while it ran is running outdated code
+    with _EXEC_POOL_LOCK:
+        entry = _EXEC_POOL.get(key)
+        if proc.poll() is None and entry is not None and entry[1] is pool:
+            pool.put(proc)
+            return
+    _discard_worker(proc)
+
+
+def _invoke_exec_worker(spec: FunctionSpec, base_dir: Path, event: Dict[str, Any], context: Dict[str, Any]) -> str:
+    """Send one request to a long-lived exec worker and return its reply line.
+
+    Workers read one JSON request per line on stdin and answer with exactly one
+    line on stdout. A pooled worker may have exited since its last reply; only
+    then, before it has seen the request, is it replaced and the request sent
+    to a fresh worker. A request is never replayed once a worker has read it.
+    Workers started before the script was last modified are not reused.
+    """
+    key = (str(base_dir), spec.command or "")
+    pool = _exec_pool(key, _command_stamp(spec, base_dir))
+    payload = _dumps({"event": event, "context": context}) + b"\n"
+    deadline = time.monotonic() + EXEC_TIMEOUT
+    try:
+        proc: Optional[subprocess.Popen] = pool.get_nowait()
+    except queue.Empty:
+        proc = None
+    if proc is not None and not _send_request(proc, payload, deadline):
+        _discard_worker(proc)
+        proc = None
+    if proc is None:
+        proc = _spawn_exec_worker(spec, base_dir)
+        if not _send_request(proc, payload, deadline):
+            returncode = _discard_worker(proc)
+            raise RuntimeError(f"exec worker exited before reading the request (code {returncode})")
+    line = _read_reply(proc, deadline)
+    if not line:
+        returncode = _discard_worker(proc)
+        raise RuntimeError(f"exec worker exited without a response (code {returncode})")
+    _release_worker(key, pool, proc)
+    return line.decode(errors="replace")
+
+
+def close_exec_workers() -> None:
+    """Stop every pooled exec worker; new ones are spawned on the next request."""
+    with _EXEC_POOL_LOCK:
+        pools = [pool for _, pool in _EXEC_POOL.values()]
+        _EXEC_POOL.clear()
+    for pool in pools:
+        _drain_pool(pool)
+
+
+atexit.register(close_exec_workers)
+
+
 def invoke_function(spec: FunctionSpec, base_dir: Path, event: Dict[str, Any], context: Dict[str, Any]) -> Tuple[int, Dict[str, str], bytes]:
     if spec.language == "python":
         if not spec.entrypoint:
@@ -76,19 +401,24 @@ def invoke_function(spec: FunctionSpec, base_dir: Path, event: Dict[str, Any], c
     elif spec.language == "exec":
         if not spec.command:
             raise RuntimeError("Exec function missing command")
-        proc = subprocess.Popen(
-            spec.command,
-            shell=True,
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            cwd=str(base_dir),
-            text=True,
-        )
-        input_str = json.dumps({"event": event, "context": context})
-        stdout, stderr = proc.communicate(input=input_str, timeout=120)
-        if proc.returncode != 0:
-            return 500, {"Content-Type": "text/plain"}, f"Error: {stderr}".encode()
+        if spec.persistent:
+            stdout = _invoke_exec_worker(spec, base_dir, event, context)
+        else:
+            args, shell = _command_args(spec)
+            proc = subprocess.Popen(
+                args,
+                shell=shell,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                cwd=str(base_dir),
+                text=True,
+            )
+            # newline-terminated so line-oriented readers (`read`) see the request
+            input_str = _dumps({"event": event, "context": context}).decode() + "\n"
+            stdout, stderr = proc.communicate(input=input_str, timeout=EXEC_TIMEOUT)
+            if proc.returncode != 0:
+                return 500, {"Content-Type": "text/plain"}, f"Error: {stderr}".encode()
         try:
             parsed = json.loads(stdout)
         except Exception:
@@ -101,6 +431,17 @@ def invoke_function(spec: FunctionSpec, base_dir: Path, event: Dict[str, Any], c
 
 def normalize_result(result: Any) -> Tuple[int, Dict[str, str], bytes]:
     # Accept Lambda-like dict {statusCode, headers, body}, or plain dict, or string/bytes
+    # Fast path for the common, already well-formed shape: exact type checks and
+    # no header copying.
+    if type(result) is dict:
+        status = result.get("statusCode")
+        headers = result.get("headers")
+        if type(status) is int and type(headers) is dict:
+            body = result.get("body")
+            if type(body) is bytes:
+                return status, headers, body
+            if type(body) is str:
+                return status, headers, body.encode()
     if isinstance(result, tuple) and len(result) == 3:
         status, headers, body = result
         if isinstance(body, str):
@@ -113,12 +454,14 @@ def normalize_result(result: Any) -> Tuple[int, Dict[str, str], bytes]:
             body = result.get("body", b"")
             if isinstance(body, (dict, list)):
                 headers = {**{"Content-Type": "application/json"}, **headers}
-                body = json.dumps(body)
-            if isinstance(body, str):
+                body = _dumps(body)
+            elif isinstance(body, str):
                 body = body.encode()
-            return status, dict(headers), body
+            if not isinstance(headers, dict):
+                headers = dict(headers)
+            return status, headers, body
         else:
-            body = json.dumps(result).encode()
+            body = _dumps(result)
             return 200, {"Content-Type": "application/json"}, body
     if isinstance(result, (bytes, bytearray)):
         return 200, {"Content-Type": "application/octet-stream"}, bytes(result)
@@ -127,9 +470,103 @@ def normalize_result(result: Any) -> Tuple[int, Dict[str, str], bytes]:
     return 200, {"Content-Type": "text/plain"}, str(result).encode()
 
 
-def write_log(name: str, record: Dict[str, Any]) -> None:
-    path = log_path(name)
+# Log records are built, encoded and appended by a single background writer so
+# request threads never touch the filesystem. Entries are (log file path,
+# record), where record is a dict or the raw pieces of an invocation record.
+_LOG_BATCH_SIZE = 256
+_LOG_QUEUE: "queue.Queue[Tuple[Path, Any]]" = queue.Queue()
+_LOG_WRITER_LOCK = threading.Lock()
+_LOG_WRITER: Optional[threading.Thread] = None
+
+
+def _open_log(files: Dict[Path, BinaryIO], path: Path) -> BinaryIO:
+    f = files.get(path)
+    if f is not None:
+        # Reopen if the file was purged or rotated underneath us
+        try:
+            if os.stat(path).st_ino == os.fstat(f.fileno()).st_ino:
+                return f
+        except OSError:
+            pass
+        f.close()
     path.parent.mkdir(parents=True, exist_ok=True)
-    with path.open("a", encoding="utf-8") as f:
-        f.write(json.dumps(record, sort_keys=True))
-        f.write("\n")
+    f = files[path] = open(path, "ab")
+    return f
+
+
+def _invocation_record(event: Dict[str, Any], status: int, headers: Dict[str, str], preview: bytes) -> Dict[str, Any]:
+    response: Dict[str, Any] = {"status": status, "headers": headers}
+    # Binary bodies don't decode into anything useful; skip the preview
+    if headers.get("Content-Type") != "application/octet-stream":
+        response["bodyPreview"] = preview.decode(errors="ignore")
+    return {"request": event, "response": response}
+
+
+def _encode_log_record(record: Any) -> Optional[bytes]:
+    # Last resort: an unencodable record is dropped rather than killing the writer
+    try:
+        if isinstance(record, tuple):
+            record = _invocation_record(*record)
+        return _dumps(record, sort_keys=True) + b"\n"
+    except Exception:
+        return None
+
+
+def _log_worker() -> None:
+    files: Dict[Path, BinaryIO] = {}
+    while True:
+        batch = [_LOG_QUEUE.get()]
+        while len(batch) < _LOG_BATCH_SIZE:
+            try:
+                batch.append(_LOG_QUEUE.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            grouped: Dict[Path, List[bytes]] = {}
+            for path, record in batch:
+                line = _encode_log_record(record)
+                if line is not None:
+                    grouped.setdefault(path, []).append(line)
+            for path, lines in grouped.items():
+                try:
+                    f = _open_log(files, path)
+                    f.write(b"".join(lines))
+                    f.flush()
+                except OSError:
+                    files.pop(path, None)
+        finally:
+            # always settle the batch so flush_logs() can't wait forever
+            for _ in batch:
+                _LOG_QUEUE.task_done()
+
+
+def _ensure_log_writer() -> None:
+    global _LOG_WRITER
+    if _LOG_WRITER is not None and _LOG_WRITER.is_alive():
+        return
+    with _LOG_WRITER_LOCK:
+        if _LOG_WRITER is None or not _LOG_WRITER.is_alive():
+            _LOG_WRITER = threading.Thread(target=_log_worker, name="fnctl-log-writer", daemon=True)
+            _LOG_WRITER.start()
+
+
+def flush_logs() -> None:
+    """Block until every queued log record has been written."""
+    if _LOG_WRITER is not None and _LOG_WRITER.is_alive():
+        _LOG_QUEUE.join()
+
+
+atexit.register(flush_logs)
+
+
+def write_log(name: str, record: Dict[str, Any], home: Optional[Path] = None) -> None:
+    """Queue ``record`` for appending to the function's log; does not block."""
+    _ensure_log_writer()
+    _LOG_QUEUE.put_nowait((log_path(name, home), record))
+
+
+def log_invocation(name: str, event: Dict[str, Any], status: int, headers: Dict[str, str], body: bytes) -> None:
+    """Queue the log record for one request; the writer thread builds and encodes it."""
+    _ensure_log_writer()
+    # snapshot the headers: handlers may reuse and mutate the dict they returned
+    _LOG_QUEUE.put_nowait((log_path(name), (event, status, dict(headers), body[:256])))
@@ -1,16 +1,31 @@
 import json
+import os
+import signal
+import socket
 import threading
-from http.server import BaseHTTPRequestHandler, HTTPServer
-from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qsl
 from pathlib import Path
-from typing import Dict, Any
+from typing import Any, Dict, Optional, Tuple
 
-from .runtime import load_spec, invoke_function, write_log
+from .runtime import RequestBody, flush_logs, load_spec, invoke_function, log_invocation, prewarm_all
 from .utils import functions_dir
 
 
+# Header lines most responses carry, encoded once
+_ENCODED_HEADERS: Dict[Tuple[str, str], bytes] = {
+    ("Content-Type", ctype): f"Content-Type: {ctype}\r\n".encode("latin-1")
+    for ctype in ("text/plain", "application/json", "application/octet-stream")
+}
+# Bodies up to this size are copied into the header buffer for a single send()
+_COALESCE_LIMIT = 64 * 1024
+
+
 class FnctlHandler(BaseHTTPRequestHandler):
     server_version = "fnctl/0.1.2"
+    protocol_version = "HTTP/1.1"
+    # Close idle keep-alive connections instead of holding their threads open
+    timeout = 15
 
     def log_message(self, format: str, *args) -> None:
         # Suppress access logs when server.quiet is True
@@ -19,21 +34,67 @@ class FnctlHandler(BaseHTTPRequestHandler):
         return super().log_message(format, *args)
 
     def _read_body(self) -> bytes:
+        encoding = self.headers.get("Transfer-Encoding")
+        if encoding:
+            if encoding.strip().lower() == "chunked":
+                return self._read_chunked()
+            # can't find where an unknown encoding ends; don't reuse the socket
+            self.close_connection = True
+            return b""
         length = int(self.headers.get("Content-Length", 0))
         if length:
             return self.rfile.read(length)
         return b""
 
+    def _read_chunked(self) -> bytes:
+        # Decode the whole body so none of its framing is left on the socket
+        # to be parsed as the next keep-alive request
+        chunks = []
+        while True:
+            size_line = self.rfile.readline(65537)
+            try:
+                size = int(size_line.split(b";", 1)[0], 16)
+            except ValueError:
+                size = -1
+            if size < 0:
+                # malformed framing: the rest of the stream can't be trusted
+                self.close_connection = True
+                break
+            if size == 0:
+                # skip optional trailer fields up to the terminating blank line
+                while self.rfile.readline(65537) not in (b"\r\n", b"\n", b""):
+                    pass
+                break
+            chunks.append(self.rfile.read(size))
+            self.rfile.readline(65537)
+        return b"".join(chunks)
+
     def _send(self, status: int, headers: Dict[str, str], body: bytes):
-        self.send_response(status)
+        # Build the whole response head ourselves so it goes out in one write
+        # (together with the body when it is small) instead of one per header.
+        self.log_request(status)
+        reason = self.responses.get(status, ("",))[0]
+        buf = bytearray(f"{self.protocol_version} {status} {reason}\r\n".encode("latin-1"))
+        buf += f"Server: {self.version_string()}\r\nDate: {self.date_time_string()}\r\n".encode("latin-1")
         for k, v in headers.items():
-            self.send_header(k, v)
-        self.send_header("Content-Length", str(len(body)))
-        self.end_headers()
-        if body:
+            line = _ENCODED_HEADERS.get((k, v))
+            if line is None:
+                line = f"{k}: {v}\r\n".encode("latin-1", "strict")
+                if k.lower() == "connection" and v.lower() == "close":
+                    self.close_connection = True
+            buf += line
+        buf += b"Content-Length: %d\r\n" % len(body)
+        buf += b"Connection: close\r\n\r\n" if self.close_connection else b"Connection: keep-alive\r\n\r\n"
+        if len(body) <= _COALESCE_LIMIT:
+            buf += body
+            self.wfile.write(buf)
+        else:
+            self.wfile.write(buf)
             self.wfile.write(body)
 
     def _handle(self):
+        # Always drain the request body so the connection can be reused
+        body_bytes = self._read_body()
         parsed = urlparse(self.path)
         parts = [p for p in parsed.path.split("/") if p]
         if len(parts) < 2 or parts[0] != "fn":
@@ -47,32 +108,35 @@ class FnctlHandler(BaseHTTPRequestHandler):
             self._send(404, {"Content-Type": "text/plain"}, f"Function not found: {e}".encode())
             return
 
-        body_bytes = self._read_body()
-        headers = {k: v for k, v in self.headers.items()}
+        headers = dict(self.headers.items())
+        # Single values stay scalars; only repeated keys become lists
+        query: Dict[str, Any] = {}
+        for k, v in parse_qsl(parsed.query):
+            if k not in query:
+                query[k] = v
+            elif isinstance(query[k], list):
+                query[k].append(v)
+            else:
+                query[k] = [query[k], v]
         event: Dict[str, Any] = {
             "method": self.command,
             "path": parsed.path,
-            "query": {k: v if len(v) > 1 else v[0] for k, v in parse_qs(parsed.query).items()},
+            "query": query,
             "headers": headers,
-            "body": body_bytes.decode(errors="ignore"),
+            "body": RequestBody(body_bytes),
         }
         context = {"function": spec.name}
 
         try:
-            status, out_headers, out_body = invoke_function(spec, fn_base, event, context)
+            # Connections each get a thread; only running handlers are bounded
+            with self.server.invoke_slots:  # type: ignore[attr-defined]
+                status, out_headers, out_body = invoke_function(spec, fn_base, event, context)
         except Exception as e:
             status, out_headers, out_body = 500, {"Content-Type": "text/plain"}, f"Error: {e}".encode()
 
         if spec.logging:
             try:
-                write_log(name, {
-                    "request": event,
-                    "response": {
-                        "status": status,
-                        "headers": out_headers,
-                        "bodyPreview": out_body[:256].decode(errors="ignore"),
-                    },
-                })
+                log_invocation(name, event, status, out_headers, out_body)
             except Exception:
                 pass
 
@@ -91,14 +155,78 @@ class FnctlHandler(BaseHTTPRequestHandler):
         self._handle()
 
 
-def serve(host: str = "127.0.0.1", port: int = 8080, quiet: bool = False):
-    httpd = HTTPServer((host, port), FnctlHandler)
+class FnctlServer(ThreadingHTTPServer):
+    """Threaded HTTP server that caps how many handlers run at once.
+
+    Every connection gets its own daemon thread, so idle keep-alive clients
+    never block new ones; ``invoke_slots`` bounds concurrent invocations.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, server_address, handler_class, max_workers: Optional[int] = None, reuse_port: bool = False):
+        self.reuse_port = reuse_port
+        self.invoke_slots = threading.BoundedSemaphore(max_workers or (os.cpu_count() or 1) * 4)
+        super().__init__(server_address, handler_class)
+
+    def server_bind(self):
+        if self.reuse_port:
+            # Lets every pre-forked worker bind its own socket on the same port;
+            # the kernel then spreads incoming connections across them.
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        super().server_bind()
+
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+def make_server(host: str = "127.0.0.1", port: int = 8080, quiet: bool = False, reuse_port: bool = False) -> FnctlServer:
+    """Bind a server without starting it; run it with ``serve_forever()``."""
+    httpd = FnctlServer((host, port), FnctlHandler, reuse_port=reuse_port)
     # Attach a flag so the handler can decide whether to log access lines
     setattr(httpd, "quiet", bool(quiet))
-    print(f"fnctl server listening on http://{host}:{port}")
+    return httpd
+
+
+def serve(host: str = "127.0.0.1", port: int = 8080, quiet: bool = False, workers: int = 1):
+    workers = max(1, int(workers))
+    if workers > 1 and not (hasattr(os, "fork") and hasattr(socket, "SO_REUSEPORT")):
+        raise RuntimeError("multiple workers need fork() and SO_REUSEPORT, which this platform lacks")
+    httpd = make_server(host, port, quiet=quiet, reuse_port=workers > 1)
+    children: Optional[list] = []
+    # Fork before any threads or handler caches exist; each worker warms its own
+    for _ in range(workers - 1):
+        pid = os.fork()
+        if pid == 0:
+            httpd.socket.close()
+            httpd = make_server(host, httpd.server_address[1], quiet=quiet, reuse_port=True)
+            children = None
+            break
+        children.append(pid)
+    if threading.current_thread() is threading.main_thread():
+        # Shut down cleanly (flushing logs, reaping workers) on SIGTERM too
+        signal.signal(signal.SIGTERM, _interrupt)
+    # Pay handler import cost before the first request rather than during it
+    prewarm_all()
+    if children is not None:
+        suffix = f" ({workers} workers)" if workers > 1 else ""
+        # Report the bound port (meaningful with --port 0) and flush so a
+        # supervising process reading our stdout sees it immediately
+        print(f"fnctl server listening on http://{host}:{httpd.server_address[1]}{suffix}", flush=True)
     try:
         httpd.serve_forever()
     except KeyboardInterrupt:
         pass
     finally:
         httpd.server_close()
+        if children is None:
+            # Worker process: never return into the CLI that forked us
+            flush_logs()
+            os._exit(0)
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+                os.waitpid(pid, 0)
+            except (ChildProcessError, ProcessLookupError):
+                pass
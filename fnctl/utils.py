@@ -1,18 +1,32 @@
+import functools
 import json
 import os
 from pathlib import Path
+from typing import Optional
 
 
 FNCTL_HOME_ENV = "FNCTL_HOME"
+SKIP_SYSTEM_CONFIG_ENV = "FNCTL_SKIP_SYSTEM_CONFIG"
 SYSTEM_CONFIG_PATH = Path("/etc/fnctl/config.json")
 
 
 def get_home() -> Path:
+    return _resolve_home(
+        os.environ.get(FNCTL_HOME_ENV) or None,
+        os.environ.get(SKIP_SYSTEM_CONFIG_ENV) == "1",
+    )
+
+
+@functools.lru_cache(maxsize=8)
+def _resolve_home(home: Optional[str], skip_system_config: bool = False) -> Path:
+    # Keyed on FNCTL_HOME so changing it mid-process still takes effect, while
+    # the system config stat/read happens once per process.
     # 1) explicit environment wins
-    home = os.environ.get(FNCTL_HOME_ENV)
     if home:
         return Path(home).expanduser()
     # 2) system-wide config (installed package path)
+    if skip_system_config:
+        return Path.home() / ".fnctl"
     try:
         if SYSTEM_CONFIG_PATH.exists():
             cfg = read_json(SYSTEM_CONFIG_PATH)
@@ -26,12 +40,12 @@ def get_home() -> Path:
     return Path.home() / ".fnctl"
 
 
-def functions_dir() -> Path:
-    return get_home() / "functions"
+def functions_dir(home: Optional[Path] = None) -> Path:
+    return (home or get_home()) / "functions"
 
 
-def logs_dir() -> Path:
-    return get_home() / "logs"
+def logs_dir(home: Optional[Path] = None) -> Path:
+    return (home or get_home()) / "logs"
 
 
 def ensure_dirs() -> None:
@@ -39,12 +53,13 @@ def ensure_dirs() -> None:
     logs_dir().mkdir(parents=True, exist_ok=True)
 
 
-def fn_dir(name: str) -> Path:
-    return functions_dir() / name
+# Path helpers take an optional explicit home; by default they use get_home().
+def fn_dir(name: str, home: Optional[Path] = None) -> Path:
+    return functions_dir(home) / name
 
 
-def fn_config_path(name: str) -> Path:
-    return fn_dir(name) / "fnctl.json"
+def fn_config_path(name: str, home: Optional[Path] = None) -> Path:
+    return fn_dir(name, home) / "fnctl.json"
 
 
 def read_json(path: Path) -> dict:
@@ -55,11 +70,18 @@ def read_json(path: Path) -> dict:
 def write_json(path: Path, data: dict) -> None:
     path.parent.mkdir(parents=True, exist_ok=True)
     tmp = path.with_suffix(path.suffix + ".tmp")
-    with tmp.open("w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2, sort_keys=True)
-        f.write("\n")
+    # Serialize once and hand the kernel the whole payload; json.dump would
+    # issue one small write per token.
+    payload = memoryview(json.dumps(data, indent=2, sort_keys=True).encode("utf-8") + b"\n")
+    fd = os.open(str(tmp), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        while payload:
+            payload = payload[os.write(fd, payload):]
+        os.fsync(fd)
+    finally:
+        os.close(fd)
     os.replace(tmp, path)
 
 
-def log_path(name: str) -> Path:
-    return logs_dir() / f"{name}.log"
+def log_path(name: str, home: Optional[Path] = None) -> Path:
+    return logs_dir(home) / f"{name}.log"
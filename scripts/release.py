@@ -18,6 +18,9 @@ SERVER_PY = ROOT / "fnctl" / "server.py"
 
 VERSION_PATTERN = re.compile(r'__version__\s*=\s*"([^"]+)"')
 SEMVER_PATTERN = re.compile(r"^(\d+)\.(\d+)\.(\d+)$")
+SETUP_VERSION_PATTERN = re.compile(r'version\s*=\s*"[^"]+"')
+INIT_VERSION_PATTERN = re.compile(r'__version__\s*=\s*"[^"]+"')
+SERVER_VERSION_PATTERN = re.compile(r'server_version\s*=\s*"fnctl/[^"]+"')
 
 
 def read_current_version() -> str:
@@ -88,13 +91,13 @@ def confirm_version(current: str, new: str) -> bool:
 
 def update_version_strings(new_version: str) -> None:
     replacements = (
-        (SETUP_PY, r'version\s*=\s*"[^"]+"', f'version="{new_version}"'),
-        (PACKAGE_INIT, r'__version__\s*=\s*"[^"]+"', f'__version__ = "{new_version}"'),
-        (SERVER_PY, r'server_version\s*=\s*"fnctl/[^"]+"', f'server_version = "fnctl/{new_version}"'),
+        (SETUP_PY, SETUP_VERSION_PATTERN, f'version="{new_version}"'),
+        (PACKAGE_INIT, INIT_VERSION_PATTERN, f'__version__ = "{new_version}"'),
+        (SERVER_PY, SERVER_VERSION_PATTERN, f'server_version = "fnctl/{new_version}"'),
     )
     for path, pattern, replacement in replacements:
         content = path.read_text(encoding="utf-8")
-        new_content, count = re.subn(pattern, replacement, content, count=1)
+        new_content, count = pattern.subn(replacement, content, count=1)
         if count != 1:
             raise SystemExit(f"Failed to update version in {path}")
         path.write_text(new_content, encoding="utf-8")
@@ -24,6 +24,9 @@ setup(
             "fnctl=fnctl.cli:main",
         ]
     },
+    extras_require={
+        "fast": ["orjson"],
+    },
     python_requires=">=3.8",
     classifiers=[
         "Programming Language :: Python :: 3",
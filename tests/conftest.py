@@ -0,0 +1,52 @@
+import shutil
+import threading
+
+import pytest
+
+import fnctl.cli as cli
+from fnctl.server import make_server
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "smoke: end-to-end checks that spawn a real fnctl process")
+
+
+@pytest.fixture(scope="module")
+def fnctl_home(tmp_path_factory):
+    """FNCTL_HOME with a ready-made 'hello' function, shared by a test module.
+
+    Tests using it must not modify the home; use ``fresh_home`` for that.
+    'hello' is created with logging off so serving it leaves the home as is.
+    """
+    home = tmp_path_factory.mktemp("fnctl_home")
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setenv("FNCTL_HOME", str(home))
+        assert cli.main(["create", "hello", "--lang", "python", "--no-logs"]) == 0
+        yield home
+
+
+@pytest.fixture
+def fresh_home(fnctl_home, tmp_path, monkeypatch):
+    """Private copy of ``fnctl_home`` for tests that create, edit or destroy."""
+    home = tmp_path / "fnctl_home"
+    shutil.copytree(fnctl_home, home)
+    monkeypatch.setenv("FNCTL_HOME", str(home))
+    return home
+
+
+@pytest.fixture
+def running_server():
+    """In-process fnctl server on a free local port; yields ``(host, port)``.
+
+    Request ``fnctl_home`` or ``fresh_home`` alongside it to pick the home served.
+    """
+    srv = make_server("127.0.0.1", 0, quiet=True)
+    # short poll interval so shutdown() returns promptly
+    t = threading.Thread(target=srv.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+    t.start()
+    try:
+        yield srv.server_address[:2]
+    finally:
+        srv.shutdown()
+        srv.server_close()
+        t.join(timeout=5)
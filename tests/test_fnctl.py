@@ -1,179 +1,416 @@
+import http.client
 import json
+import logging
 import os
-import socket
 import subprocess
 import sys
-import tempfile
+import threading
 import time
 from pathlib import Path
-from contextlib import contextmanager
-from urllib.request import urlopen
+from types import MappingProxyType
+
+import pytest
 
 import fnctl.cli as cli
-from fnctl.runtime import load_spec, invoke_function, write_log
+import fnctl.runtime as runtime
+from fnctl.runtime import RequestBody, _import_python_handler, _split_command, close_exec_workers, flush_logs, load_spec, invoke_function, log_invocation, normalize_result, write_log
 from fnctl.utils import fn_dir, log_path
 
 
+# Shown with: pytest --log-cli-level=DEBUG
+LOG = logging.getLogger(__name__)
+
 ROOT = Path(__file__).resolve().parents[1]
 HOST = "127.0.0.1"
 
+# Shared, read-only invocation payloads so handlers can't leak state between tests
+INVOKE_EVENT = MappingProxyType({
+    "method": "GET",
+    "path": "/fn/hello",
+    "query": MappingProxyType({"name": "dev"}),
+    "headers": MappingProxyType({}),
+    "body": RequestBody(b""),
+})
+INVOKE_CTX = MappingProxyType({"function": "hello"})
+
 
 def run_cli(args):
-    print(f"[fnctl CLI] $ fnctl {' '.join(args)}")
+    LOG.debug("[fnctl CLI] $ fnctl %s", " ".join(args))
     rc = cli.main(args)
-    print(f"[fnctl CLI] exit code: {rc}\n")
+    LOG.debug("[fnctl CLI] exit code: %s", rc)
     return rc
 
 
-@contextmanager
-def set_env(env: dict):
-    old = {k: os.environ.get(k) for k in env}
+def test_create_list_invoke_python_function(tmp_path, monkeypatch):
+    home = tmp_path
+    # the CLI resolves FNCTL_HOME itself; runtime calls below get home= directly
+    monkeypatch.setenv("FNCTL_HOME", str(home))
+    LOG.debug("[setup] temp FNCTL_HOME: %s", home)
+
+    # list (empty)
+    rc = run_cli(["list"])
+    assert rc == 0
+
+    # create python function
+    rc = run_cli(["create", "hello", "--lang", "python"])
+    assert rc == 0
+    LOG.debug("[create] created function at %s", home / "functions" / "hello")
+
+    # list should show it
+    rc = run_cli(["list"])
+    assert rc == 0
+
+    # invoke via runtime API
+    spec = load_spec("hello", home=home)
+    base = fn_dir("hello", home=home)
+    LOG.debug("[invoke] base_dir=%s, entrypoint=%s", base, spec.entrypoint)
+    status, headers, body = invoke_function(
+        spec,
+        base,
+        INVOKE_EVENT,
+        INVOKE_CTX,
+    )
+    LOG.debug("[invoke] status=%s, headers=%s", status, headers)
+    LOG.debug("[invoke] body=%r", body)
+    assert status == 200
+    assert headers.get("Content-Type") == "application/json"
+    data = json.loads(body)
+    assert data.get("hello") == "dev"
+    assert data.get("from") == "hello"
+
+
+def test_destroy_removes_function_and_optional_logs(fresh_home):
+    LOG.debug("[setup] temp FNCTL_HOME: %s", fresh_home)
+    base = fn_dir("hello", home=fresh_home)
+    assert base.exists()
+
+    # write a log entry to simulate prior traffic
+    write_log("hello", {"msg": "test"}, home=fresh_home)
+    flush_logs()
+    lp = log_path("hello", home=fresh_home)
+    LOG.debug("[logs] wrote log: %s", lp)
+    assert lp.exists()
+
+    # destroy without purging logs (logs should remain)
+    rc = run_cli(["destroy", "hello"])
+    assert rc == 0
+    assert not base.exists()
+    LOG.debug("[destroy] function removed, logs kept")
+    assert lp.exists()
+
+    # recreate and destroy with --purge-logs (logs should be removed)
+    rc = run_cli(["create", "hello", "--lang", "python"])
+    assert rc == 0
+    write_log("hello", {"msg": "again"}, home=fresh_home)
+    flush_logs()
+    assert log_path("hello", home=fresh_home).exists()
+    rc = run_cli(["destroy", "hello", "--purge-logs"])
+    assert rc == 0
+    assert not fn_dir("hello", home=fresh_home).exists()
+    LOG.debug("[destroy --purge-logs] logs removed")
+    assert not log_path("hello", home=fresh_home).exists()
+
+
+def _appended_log_lines(lp, before):
+    with open(lp, "rb") as f:
+        f.seek(before)
+        return [json.loads(line) for line in f.read().splitlines()]
+
+
+def test_log_writer_survives_a_record_that_fails_to_encode(fresh_home):
+    lp = log_path("hello", home=fresh_home)
+    before = lp.stat().st_size if lp.exists() else 0
+    write_log("hello", {"msg": object()}, home=fresh_home)
+    write_log("hello", {"msg": "after"}, home=fresh_home)
+    # returns only if the writer settled the bad record and kept going
+    flush_logs()
+    assert _appended_log_lines(lp, before) == [{"msg": "after"}]
+
+
+def test_log_invocation_records_headers_as_returned(fresh_home):
+    lp = log_path("hello", home=fresh_home)
+    before = lp.stat().st_size if lp.exists() else 0
+    headers = {"Content-Type": "text/plain", "X-Req": "1"}
+    event = {"method": "GET", "path": "/fn/hello", "query": {}, "headers": {}, "body": RequestBody(b"")}
+    log_invocation("hello", event, 200, headers, b"ok")
+    # a handler reusing its headers dict for the next response
+    headers["X-Req"] = "2"
+    headers["X-Extra"] = "yes"
+    flush_logs()
+    [record] = _appended_log_lines(lp, before)
+    assert record["response"]["headers"] == {"Content-Type": "text/plain", "X-Req": "1"}
+
+
+def test_load_spec_picks_up_config_changes(fresh_home):
+    assert load_spec("hello", home=fresh_home).logging is False
+    # cached spec is reused while the config is unchanged
+    assert load_spec("hello", home=fresh_home) is load_spec("hello", home=fresh_home)
+
+    rc = run_cli(["enable-logs", "hello"])
+    assert rc == 0
+    assert load_spec("hello", home=fresh_home).logging is True
+
+
+def test_similarly_named_python_functions_load_separately(fresh_home):
+    # my-fn and my_fn sanitize to the same characters
+    for name in ("my-fn", "my_fn"):
+        assert run_cli(["create", name, "--lang", "python"]) == 0
+    handlers = [_import_python_handler(fn_dir(name, home=fresh_home), "main:handler") for name in ("my-fn", "my_fn")]
+    assert handlers[0].__module__ != handlers[1].__module__
+    assert all(sys.modules[h.__module__].handler is h for h in handlers)
+
+
+def test_request_body_is_bytes_with_lazy_text():
+    body = RequestBody("héllo".encode("utf-8"))
+    assert body == "héllo".encode("utf-8")
+    assert body.text == "héllo"
+    assert str(body) == "héllo"
+    assert json.loads(RequestBody(b'{"a": 1}')) == {"a": 1}
+
+
+def test_json_bodies_do_not_depend_on_orjson():
+    # orjson rejects integers wider than 64 bits; stdlib json does not
+    status, headers, body = normalize_result({"id": 2**70})
+    assert status == 200
+    assert json.loads(body) == {"id": 2**70}
+
+
+def test_only_request_bodies_serialize_bytes_as_text():
+    assert json.loads(normalize_result({"body": RequestBody(b"hi")})[2]) == {"body": "hi"}
+    # raw bytes in a response are an error, not silently decoded
+    with pytest.raises(TypeError):
+        normalize_result({"a": b"\xff"})
+
+
+@pytest.mark.skipif(os.name != "posix", reason="argv splitting is POSIX-only")
+def test_split_command_falls_back_to_shell():
+    assert _split_command("./handler.sh --flag 'a b'") == ["./handler.sh", "--flag", "a b"]
+    assert _split_command("./handler.sh | jq .") is None
+    assert _split_command("VAR=x ./handler.sh") is None
+    assert _split_command("./handler.sh 'unbalanced") is None
+    for command in ("exec ./handler.sh", "source ./env.sh", ". ./env.sh", "ulimit -n 64"):
+        assert _split_command(command) is None
+
+
+def test_persistent_exec_worker_is_reused(fresh_home):
+    rc = run_cli(["create", "shell", "--lang", "exec"])
+    assert rc == 0
+    base = fn_dir("shell", home=fresh_home)
+    # reply with the worker's pid so reuse is observable
+    (base / "handler.sh").write_text(
+        "#!/usr/bin/env bash\n"
+        "while IFS= read -r INPUT; do\n"
+        "  printf '{\"statusCode\":200, \"body\":\"%s\"}\\n' \"$$\"\n"
+        "done\n",
+        encoding="utf-8",
+    )
+    spec = load_spec("shell", home=fresh_home)
+    assert spec.persistent is True
+    event = {"method": "GET", "path": "/fn/shell", "query": {}, "headers": {}, "body": ""}
     try:
-        os.environ.update({k: str(v) for k, v in env.items()})
-        for k, v in env.items():
-            print(f"[env] {k}={v}")
-        yield
+        _, _, first = invoke_function(spec, base, event, {"function": "shell"})
+        status, _, second = invoke_function(spec, base, event, {"function": "shell"})
     finally:
-        for k, v in old.items():
-            if v is None and k in os.environ:
-                del os.environ[k]
-            elif v is not None:
-                os.environ[k] = v
-
-
-def _free_port() -> int:
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        s.bind((HOST, 0))
-        return s.getsockname()[1]
-
-
-def _wait_for_port(port: int, timeout: float = 5.0) -> None:
-    deadline = time.time() + timeout
-    while time.time() < deadline:
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
-            sock.settimeout(0.5)
-            try:
-                sock.connect((HOST, port))
-                return
-            except OSError:
-                time.sleep(0.1)
-    raise RuntimeError(f"Server did not start on port {port}")
-
-
-def test_create_list_invoke_python_function():
-    with tempfile.TemporaryDirectory() as td:
-        home = Path(td)
-        with set_env({"FNCTL_HOME": str(home)}):
-            print(f"[setup] temp FNCTL_HOME: {home}")
-
-            # list (empty)
-            rc = run_cli(["list"])
-            assert rc == 0
-
-            # create python function
-            rc = run_cli(["create", "hello", "--lang", "python"])
-            assert rc == 0
-            print(f"[create] created function at {home / 'functions' / 'hello'}")
-
-            # list should show it
-            rc = run_cli(["list"])
-            assert rc == 0
-
-            # invoke via runtime API
-            spec = load_spec("hello")
-            base = home / "functions" / "hello"
-            print(f"[invoke] base_dir={base}, entrypoint={spec.entrypoint}")
-            status, headers, body = invoke_function(
-                spec,
-                base,
-                {"method": "GET", "path": "/fn/hello", "query": {"name": "dev"}, "headers": {}, "body": ""},
-                {"function": "hello"},
-            )
-            print(f"[invoke] status={status}, headers={headers}")
-            print(f"[invoke] body={body.decode(errors='ignore')}")
-            assert status == 200
-            assert headers.get("Content-Type") == "application/json"
-            data = json.loads(body.decode())
-            assert data.get("hello") == "dev"
-            assert data.get("from") == "hello"
-
-
-def test_destroy_removes_function_and_optional_logs():
-    with tempfile.TemporaryDirectory() as td:
-        home = Path(td)
-        with set_env({"FNCTL_HOME": str(home)}):
-            print(f"[setup] temp FNCTL_HOME: {home}")
-            # create function
-            rc = run_cli(["create", "hello", "--lang", "python"])
-            assert rc == 0
-            base = fn_dir("hello")
-            print(f"[create] created: {base}")
-            assert base.exists()
-
-            # write a log entry to simulate prior traffic
-            write_log("hello", {"msg": "test"})
-            lp = log_path("hello")
-            print(f"[logs] wrote log: {lp}")
-            assert lp.exists()
-
-            # destroy without purging logs (logs should remain)
-            rc = run_cli(["destroy", "hello"])
-            assert rc == 0
-            assert not base.exists()
-            print(f"[destroy] function removed, logs kept: exists={lp.exists()}")
-            assert lp.exists()
-
-            # recreate and destroy with --purge-logs (logs should be removed)
-            rc = run_cli(["create", "hello", "--lang", "python"])
-            assert rc == 0
-            write_log("hello", {"msg": "again"})
-            assert log_path("hello").exists()
-            rc = run_cli(["destroy", "hello", "--purge-logs"])
-            assert rc == 0
-            assert not fn_dir("hello").exists()
-            print(f"[destroy --purge-logs] logs removed: exists={log_path('hello').exists()}")
-            assert not log_path("hello").exists()
-
-
-def test_serve_command_handles_http_request():
-    with tempfile.TemporaryDirectory() as td:
-        home = Path(td)
-        with set_env({"FNCTL_HOME": str(home)}):
-            rc = run_cli(["create", "hello", "--lang", "python"])
-            assert rc == 0
-
-            port = _free_port()
-            env = os.environ.copy()
-            cmd = [
-                sys.executable,
-                "-m",
-                "fnctl.cli",
-                "serve",
-                "--host",
-                HOST,
-                "--port",
-                str(port),
-                "--quiet",
-            ]
-            proc = subprocess.Popen(
-                cmd,
-                cwd=str(ROOT),
-                env=env,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
+        close_exec_workers()
+    assert status == 200
+    assert first == second
+
+
+def test_persistent_exec_worker_restarts_after_script_edit(fresh_home):
+    rc = run_cli(["create", "edited", "--lang", "exec"])
+    assert rc == 0
+    base = fn_dir("edited", home=fresh_home)
+    script = base / "handler.sh"
+    spec = load_spec("edited", home=fresh_home)
+    event = {"method": "GET", "path": "/fn/edited", "query": {}, "headers": {}, "body": ""}
+    bodies = []
+    try:
+        for version in ("v1", "v2"):
+            script.write_text(
+                "#!/usr/bin/env bash\n"
+                "while IFS= read -r INPUT; do\n"
+                f"  echo '{{\"statusCode\":200, \"body\":\"{version}\"}}'\n"
+                "done\n",
+                encoding="utf-8",
             )
-            try:
-                _wait_for_port(port)
-                with urlopen(f"http://{HOST}:{port}/fn/hello?name=test", timeout=5) as response:
-                    body = response.read().decode("utf-8")
-                data = json.loads(body)
-                assert data["hello"] == "test"
-                assert data["from"] == "hello"
-            finally:
-                proc.terminate()
-                try:
-                    proc.communicate(timeout=5)
-                except subprocess.TimeoutExpired:
-                    proc.kill()
-                    proc.communicate(timeout=5)
+            # make the edit visible even on coarse-timestamp filesystems
+            stamp = time.time_ns() + (len(bodies) + 1) * 10**9
+            os.utime(script, ns=(stamp, stamp))
+            bodies.append(invoke_function(spec, base, event, {"function": "edited"})[2])
+    finally:
+        close_exec_workers()
+    assert bodies == [b"v1", b"v2"]
+
+
+def test_persistent_exec_worker_that_stops_reading_is_replaced(fresh_home):
+    rc = run_cli(["create", "once", "--lang", "exec"])
+    assert rc == 0
+    base = fn_dir("once", home=fresh_home)
+    # closes stdin before replying, so every pooled worker refuses the next write
+    (base / "handler.sh").write_text(
+        "#!/usr/bin/env bash\n"
+        "read -r INPUT\n"
+        "exec 0<&-\n"
+        "echo '{\"statusCode\":200, \"body\":\"ok\"}'\n",
+        encoding="utf-8",
+    )
+    spec = load_spec("once", home=fresh_home)
+    event = {"method": "GET", "path": "/fn/once", "query": {}, "headers": {}, "body": ""}
+    try:
+        statuses = [invoke_function(spec, base, event, {"function": "once"})[0] for _ in range(20)]
+    finally:
+        close_exec_workers()
+    assert statuses == [200] * 20
+
+
+def test_persistent_exec_worker_timeout_kills_handler_without_replay(fresh_home, monkeypatch):
+    monkeypatch.setattr(runtime, "EXEC_TIMEOUT", 1)
+    rc = run_cli(["create", "slow", "--lang", "exec"])
+    assert rc == 0
+    base = fn_dir("slow", home=fresh_home)
+    # count every request the worker sees; hang in a child process on /hang
+    (base / "handler.sh").write_text(
+        "#!/usr/bin/env bash\n"
+        "while IFS= read -r INPUT; do\n"
+        "  echo x >> calls\n"
+        "  case \"$INPUT\" in *'\"/hang\"'*) sleep 6 ;; esac\n"
+        "  echo '{\"statusCode\":200, \"body\":\"ok\"}'\n"
+        "done\n",
+        encoding="utf-8",
+    )
+    spec = load_spec("slow", home=fresh_home)
+    event = {"method": "GET", "path": "/fn/slow", "query": {}, "headers": {}, "body": ""}
+    try:
+        # leaves a pooled worker behind, so the hanging request goes to it
+        assert invoke_function(spec, base, event, {"function": "slow"})[0] == 200
+        start = time.monotonic()
+        with pytest.raises(subprocess.TimeoutExpired):
+            invoke_function(spec, base, {**event, "path": "/hang"}, {"function": "slow"})
+        assert time.monotonic() - start < 3
+    finally:
+        close_exec_workers()
+    assert (base / "calls").read_text(encoding="utf-8").splitlines() == ["x", "x"]
+
+
+def test_serve_command_handles_http_request(fnctl_home, running_server):
+    host, port = running_server
+    conn = http.client.HTTPConnection(host, port, timeout=5)
+    try:
+        # warm-up request opens the connection; the second must reuse it
+        conn.request("GET", "/fn/hello")
+        conn.getresponse().read()
+        sock = conn.sock
+        conn.request("GET", "/fn/hello?name=test")
+        data = json.loads(conn.getresponse().read())
+        assert conn.sock is sock
+        assert data["hello"] == "test"
+        assert data["from"] == "hello"
+    finally:
+        conn.close()
+
+
+def test_chunked_post_does_not_corrupt_next_request(fresh_home, running_server):
+    assert run_cli(["create", "echo", "--lang", "python"]) == 0
+    (fn_dir("echo", home=fresh_home) / "main.py").write_text(
+        "def handler(event, context):\n    return event['body'].text\n", encoding="utf-8"
+    )
+    host, port = running_server
+    conn = http.client.HTTPConnection(host, port, timeout=5)
+    try:
+        conn.request("POST", "/fn/echo", body=iter([b"hello", b" world"]), encode_chunked=True)
+        resp = conn.getresponse()
+        assert resp.status == 200
+        assert resp.read() == b"hello world"
+        # the chunk framing must not be left on the socket as a bogus request
+        conn.request("GET", "/fn/hello?name=next")
+        resp = conn.getresponse()
+        assert resp.status == 200
+        assert json.loads(resp.read())["hello"] == "next"
+    finally:
+        conn.close()
+
+
+@pytest.mark.parametrize("size", [b"-1", b"zz"])
+def test_malformed_chunk_size_closes_connection(fnctl_home, running_server, size):
+    host, port = running_server
+    conn = http.client.HTTPConnection(host, port, timeout=5)
+    try:
+        conn.putrequest("POST", "/fn/hello")
+        conn.putheader("Transfer-Encoding", "chunked")
+        conn.endheaders()
+        conn.send(size + b"\r\nhello\r\n")
+        start = time.monotonic()
+        resp = conn.getresponse()
+        resp.read()
+        # answered right away instead of reading to EOF, then hung up
+        assert time.monotonic() - start < 2
+        assert resp.getheader("Connection") == "close"
+    finally:
+        conn.close()
+
+
+def test_idle_keepalive_connections_do_not_block_new_requests(fnctl_home, running_server):
+    host, port = running_server
+    # one more idle client than there are invocation slots
+    idle = [http.client.HTTPConnection(host, port, timeout=5) for _ in range((os.cpu_count() or 1) * 4 + 1)]
+    conn = http.client.HTTPConnection(host, port, timeout=2)
+    try:
+        for c in idle:
+            c.request("GET", "/fn/hello")
+            c.getresponse().read()
+        start = time.monotonic()
+        conn.request("GET", "/fn/hello?name=late")
+        data = json.loads(conn.getresponse().read())
+        assert data["hello"] == "late"
+        assert time.monotonic() - start < 2
+    finally:
+        for c in idle + [conn]:
+            c.close()
+
+
+@pytest.mark.smoke
+def test_serve_cli_smoke(fnctl_home):
+    # only what the child needs, not a copy of the whole parent environment
+    env = {k: os.environ[k] for k in ("PATH", "SYSTEMROOT") if k in os.environ}
+    env["FNCTL_HOME"] = str(fnctl_home)
+    # import fnctl from the checkout via PYTHONPATH rather than cwd=
+    env["PYTHONPATH"] = os.pathsep.join(p for p in (str(ROOT), os.environ.get("PYTHONPATH")) if p)
+    # --port 0: the server binds any free port and reports it on stdout
+    cmd = [sys.executable, "-m", "fnctl.cli", "serve", "--host", HOST, "--port", "0", "--quiet"]
+    # No cwd, no fd closing, no new session: this lets CPython use posix_spawn
+    # instead of fork+exec on POSIX (our fds are non-inheritable anyway).
+    proc = subprocess.Popen(
+        cmd,
+        env=env,
+        # stdout carries the port handshake; nothing reads stderr
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        text=True,
+        close_fds=(os.name != "posix"),
+        start_new_session=False,
+        pass_fds=(),
+    )
+    # don't hang forever if the child never reports its port
+    watchdog = threading.Timer(10, proc.kill)
+    watchdog.start()
+    try:
+        line = proc.stdout.readline()
+        watchdog.cancel()
+        assert "listening on" in line, line
+        port = int(line.rsplit(":", 1)[1])
+        conn = http.client.HTTPConnection(HOST, port, timeout=5)
+        try:
+            conn.request("GET", "/fn/hello?name=smoke")
+            data = json.loads(conn.getresponse().read())
+        finally:
+            conn.close()
+        assert data == {"hello": "smoke", "from": "hello"}
+    finally:
+        watchdog.cancel()
+        proc.terminate()
+        try:
+            proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait(timeout=5)
+        proc.stdout.close()